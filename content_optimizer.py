@@ -0,0 +1,228 @@
+# 图文正文后处理（图片转存、压缩、体积限制）
+# content_optimizer.py
+import os
+import re
+import base64
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+import requests
+
+from pipeline import map_concurrently
+
+# 已在公众号图床上的图片无需转存
+WECHAT_IMAGE_HOSTS = ("mmbiz.qpic.cn", "mmbiz.qlogo.cn")
+
+IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+# src 前须为空白，避免匹配 data-src 等属性
+IMG_SRC_RE = re.compile(r"""(?<=\s)src\s*=\s*(["'])(.*?)\1""", re.IGNORECASE | re.DOTALL)
+DATA_URI_RE = re.compile(r"^data:image/([\w.+-]+);base64,(.*)$", re.IGNORECASE | re.DOTALL)
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+PRE_RE = re.compile(r"(<pre\b.*?</pre>)", re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*?(/?)>")
+# 标签之间的空白，前后任一为块元素时可删除，否则保留一个空格
+BETWEEN_TAGS_RE = re.compile(r"(</?([a-zA-Z][\w-]*)[^>]*>)\s+(?=</?([a-zA-Z][\w-]*))")
+
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "header", "footer", "blockquote", "pre", "figure", "figcaption",
+    "ul", "ol", "li", "table", "thead", "tbody", "tr", "td", "th", "hr", "br",
+    "h1", "h2", "h3", "h4", "h5", "h6",
+}
+VOID_TAGS = {"img", "br", "hr", "input", "meta", "link", "source", "wbr", "col", "area", "base", "embed"}
+
+
+class ContentTooLarge(Exception):
+    """正文无法压缩到公众号限制以内"""
+
+
+def minify_html(html: str) -> str:
+    """去除注释与块元素间空白，折叠连续空白（<pre> 内保持原样，行内元素间保留一个空格）"""
+    def _between_tags(match):
+        if match.group(2).lower() in BLOCK_TAGS or match.group(3).lower() in BLOCK_TAGS:
+            return match.group(1)
+        return match.group(1) + " "
+
+    html = COMMENT_RE.sub("", html)
+    parts = PRE_RE.split(html)
+    for i in range(0, len(parts), 2):
+        part = BETWEEN_TAGS_RE.sub(_between_tags, parts[i])
+        # <pre> 为块元素，与其相邻的空白可删除
+        if i > 0:
+            part = part.lstrip()
+        if i < len(parts) - 1:
+            part = part.rstrip()
+        parts[i] = re.sub(r"\s{2,}", " ", part)
+    return "".join(parts).strip()
+
+
+def content_size(html: str) -> Tuple[int, int]:
+    """返回 (字符数, UTF-8字节数)"""
+    return len(html), len(html.encode("utf-8"))
+
+
+def content_limits() -> Tuple[int, int]:
+    """公众号图文正文限制 (字符数, 字节数)：不超过2万字符，且小于1M（调用时读取环境变量）"""
+    return (
+        int(os.getenv("WECHAT_MAX_CONTENT_CHARS", "20000")),
+        int(os.getenv("WECHAT_MAX_CONTENT_BYTES", str(1024 * 1024 - 1))),
+    )
+
+
+def fits_budget(html: str, limits: Tuple[int, int] = None) -> bool:
+    max_chars, max_bytes = limits or content_limits()
+    chars, size = content_size(html)
+    return chars <= max_chars and size <= max_bytes
+
+
+def top_level_block_ends(html: str) -> List[int]:
+    """顶层（不在任何未闭合元素内）块元素结束位置"""
+    ends = []
+    depth = 0
+    for match in TAG_RE.finditer(html):
+        closing, name, self_closing = match.group(1), match.group(2).lower(), match.group(3)
+        if name in VOID_TAGS or self_closing:
+            continue
+        if not closing:
+            depth += 1
+            continue
+        depth = max(depth - 1, 0)
+        if depth == 0 and name in BLOCK_TAGS:
+            ends.append(match.end())
+    return ends
+
+
+def enforce_budget(html: str, truncate: bool = None) -> str:
+    """
+    检查正文体积限制；开启截断时在顶层块元素边界处截断正文末尾
+
+    Args:
+        truncate: 超出限制时是否截断，默认取环境变量 WECHAT_TRUNCATE_OVERSIZED（默认中止）
+
+    Raises:
+        ContentTooLarge: 超出限制且未开启截断，或第一个顶层块元素本身就超出限制
+    """
+    limits = content_limits()
+    if fits_budget(html, limits):
+        return html
+
+    chars, size = content_size(html)
+    if truncate is None:
+        truncate = os.getenv("WECHAT_TRUNCATE_OVERSIZED", "false").lower() == "true"
+    if not truncate:
+        raise ContentTooLarge(
+            f"正文超出限制: {chars}字符/{size}字节（限制 {limits[0]}字符/{limits[1]}字节）"
+        )
+
+    cut = None
+    for end in top_level_block_ends(html):
+        if not fits_budget(html[:end], limits):
+            break
+        cut = end
+
+    if cut is None:
+        raise ContentTooLarge(f"正文超出限制且无法截断: {chars}字符/{size}字节")
+
+    logger.warning(
+        f"正文超出限制（{chars}字符/{size}字节），已截断至 {cut} 字符"
+        f"（限制 {limits[0]}字符/{limits[1]}字节）"
+    )
+    return html[:cut]
+
+
+class ContentOptimizer:
+    """
+    草稿提交前的正文处理
+
+    1. 找出正文中的外部图片，并发下载，按内容哈希去重后
+       通过 media/uploadimg 并发上传，再替换为公众号图片URL
+    2. 压缩HTML
+    3. 检查公众号体积限制，超出时中止（或按 WECHAT_TRUNCATE_OVERSIZED 截断）
+    """
+
+    def __init__(self, wechat, max_workers: int = None):
+        self.wechat = wechat
+        self.max_workers = max_workers or int(os.getenv("CONTENT_IMAGE_WORKERS", "4"))
+
+    def optimize(self, html: str) -> str:
+        html = self.inline_images(html)
+        html = minify_html(html)
+        return enforce_budget(html)
+
+    @staticmethod
+    def _needs_upload(src: str) -> bool:
+        if src.startswith("data:"):
+            return True
+        return src.startswith(("http://", "https://", "//")) and not any(
+            host in src for host in WECHAT_IMAGE_HOSTS
+        )
+
+    @staticmethod
+    def _load(src: str) -> Optional[bytes]:
+        """读取图片内容（data URI 或网络图片），失败返回 None"""
+        match = DATA_URI_RE.match(src)
+        if match:
+            try:
+                return base64.b64decode(match.group(2))
+            except Exception as e:
+                logger.warning(f"data URI 图片解码失败: {e}")
+                return None
+
+        url = "https:" + src if src.startswith("//") else src
+        try:
+            resp = requests.get(url, timeout=30)
+            if resp.status_code == 200:
+                return resp.content
+            logger.warning(f"正文图片下载失败，状态码 {resp.status_code}: {url[:100]}")
+        except Exception as e:
+            logger.warning(f"正文图片下载异常: {e}")
+        return None
+
+    def _upload(self, content: bytes) -> Optional[str]:
+        filename = "image.png" if content.startswith(b"\x89PNG") else "image.jpg"
+        return self.wechat.upload_content_image(content, filename)
+
+    def inline_images(self, html: str) -> str:
+        """转存正文图片并替换URL，转存失败的图片标签会被移除"""
+        sources: List[str] = []
+        for tag in IMG_TAG_RE.findall(html):
+            match = IMG_SRC_RE.search(tag)
+            if match and self._needs_upload(match.group(2)) and match.group(2) not in sources:
+                sources.append(match.group(2))
+        if not sources:
+            return html
+
+        # 下载后按内容哈希去重，相同图片只上传一次
+        contents = map_concurrently(self._load, sources, self.max_workers)
+        by_hash: Dict[str, bytes] = {}
+        src_hash: Dict[str, str] = {}
+        for src, content in zip(sources, contents):
+            if content is None:
+                continue
+            digest = hashlib.sha256(content).hexdigest()
+            by_hash.setdefault(digest, content)
+            src_hash[src] = digest
+
+        digests = list(by_hash)
+        uploaded = dict(zip(digests, map_concurrently(self._upload, [by_hash[d] for d in digests], self.max_workers)))
+
+        replacements: Dict[str, Optional[str]] = {
+            src: uploaded.get(src_hash.get(src)) for src in sources
+        }
+        logger.info(
+            f"正文图片处理完成: {len(sources)} 张，去重后上传 {len(digests)} 张，"
+            f"失败 {sum(1 for url in replacements.values() if not url)} 张"
+        )
+
+        def _rewrite(match):
+            tag = match.group(0)
+            src_match = IMG_SRC_RE.search(tag)
+            if not src_match or src_match.group(2) not in replacements:
+                return tag
+            new_url = replacements[src_match.group(2)]
+            if not new_url:
+                # 公众号不展示外链图片，直接移除
+                return ""
+            quote = src_match.group(1)
+            return tag[:src_match.start()] + f"src={quote}{new_url}{quote}" + tag[src_match.end():]
+
+        return IMG_TAG_RE.sub(_rewrite, html)
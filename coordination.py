@@ -0,0 +1,226 @@
+# 多副本协调（主节点选举 + 按账号分片的任务租约）
+# coordination.py
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import zlib
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+from loguru import logger
+
+
+class CoordinationStore(ABC):
+    """
+    协调存储接口：基于租约的互斥
+
+    租约在 ttl 秒后自动过期；持有者可重复 acquire 以续约。
+    Redis 实现可对应为 SET NX PX（acquire）、比较后删除的 Lua 脚本（release）和 GET（owner_of）。
+    """
+
+    @abstractmethod
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """租约空闲、已过期或已由 owner 持有时获取（续约），返回是否成功"""
+
+    @abstractmethod
+    def release(self, name: str, owner: str) -> bool:
+        """释放 owner 持有的租约"""
+
+    @abstractmethod
+    def owner_of(self, name: str) -> Optional[str]:
+        """当前有效租约的持有者，无则返回 None"""
+
+
+class SQLiteCoordinationStore(CoordinationStore):
+    """
+    基于 SQLite 的协调存储
+
+    各副本需共享同一个数据库文件（同机多进程或共享卷），
+    路径由环境变量 COORD_DB_PATH 指定。
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("COORD_DB_PATH", "data/coordination.sqlite3")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                " name TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: 手动控制事务，BEGIN IMMEDIATE 保证读-改-写的原子性
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + ttl),
+            )
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"租约获取异常 {name}: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return False
+        finally:
+            conn.close()
+
+    def release(self, name: str, owner: str) -> bool:
+        conn = self._connect()
+        try:
+            cur = conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+            return cur.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"租约释放异常 {name}: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def owner_of(self, name: str) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT owner FROM leases WHERE name = ? AND expires_at > ?", (name, time.time())
+            ).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+
+class JobLease:
+    """
+    heartbeat() 期间持有的任务租约
+
+    续约失败（租约已过期并被其它副本接手，或存储不可用）后不再续约，held 恒为 False；
+    调用方在提交草稿、发布和标记完成等不可重复的操作前应检查 held。
+    """
+
+    def __init__(self, store: CoordinationStore, name: str, owner: str):
+        self.store = store
+        self.name = name
+        self.owner = owner
+        self._lost = threading.Event()
+
+    def _mark_lost(self):
+        self._lost.set()
+
+    @property
+    def held(self) -> bool:
+        return not self._lost.is_set() and self.store.owner_of(self.name) == self.owner
+
+
+class Coordinator:
+    """
+    副本间协调
+
+    - 主节点选举：持有 leader 租约的副本负责定时触发，并开启当日任务（run）
+    - 任务分片：每个账号是一个独立任务，副本通过租约领取，完成后写入完成标记防止重复发布；
+      持有者崩溃时任务租约过期，其它副本可接手
+    """
+
+    def __init__(self, store: CoordinationStore, replica_id: str = None):
+        self.store = store
+        self.replica_id = replica_id or os.getenv("REPLICA_ID") or \
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.leader_ttl = float(os.getenv("COORD_LEADER_TTL", "90"))
+        # 任务执行期间由 heartbeat() 每 job_ttl/3 秒续约，ttl 只需覆盖心跳间隔与故障接管时间
+        self.job_ttl = float(os.getenv("COORD_JOB_TTL", "300"))
+        self.done_ttl = float(os.getenv("COORD_DONE_TTL", str(2 * 86400)))
+
+    def is_leader(self) -> bool:
+        """获取或续约 leader 租约"""
+        return self.store.acquire("leader", self.replica_id, self.leader_ttl)
+
+    def leader(self) -> Optional[str]:
+        return self.store.owner_of("leader")
+
+    def open_run(self, run_id: str) -> bool:
+        """开启一轮任务（仅主节点调用），返回是否为本副本新开启"""
+        return self.store.acquire(f"run:{run_id}", self.replica_id, self.done_ttl)
+
+    def run_is_open(self, run_id: str) -> bool:
+        return self.store.owner_of(f"run:{run_id}") is not None
+
+    def claim(self, run_id: str, shard: str) -> bool:
+        """领取一个未完成的分片任务"""
+        if self.store.owner_of(f"done:{run_id}:{shard}") is not None:
+            return False
+        if not self.store.acquire(f"job:{run_id}:{shard}", self.replica_id, self.job_ttl):
+            return False
+        # 获取租约前可能刚有其它副本完成并释放，需再次确认
+        if self.store.owner_of(f"done:{run_id}:{shard}") is not None:
+            self.store.release(f"job:{run_id}:{shard}", self.replica_id)
+            return False
+        return True
+
+    def finish(self, run_id: str, shard: str) -> bool:
+        """
+        标记分片完成（done_ttl 内不会被任何副本再次领取）并释放任务租约
+
+        任务租约已不由本副本持有时（已被其它副本接手）不做标记，返回 False。
+        """
+        if self.store.owner_of(f"job:{run_id}:{shard}") != self.replica_id:
+            logger.warning(f"副本 {self.replica_id} 已不持有任务租约，不标记完成: {run_id}/{shard}")
+            return False
+        self.store.acquire(f"done:{run_id}:{shard}", self.replica_id, self.done_ttl)
+        self.store.release(f"job:{run_id}:{shard}", self.replica_id)
+        return True
+
+    @contextmanager
+    def heartbeat(self, run_id: str, shard: str) -> Iterator[JobLease]:
+        """
+        执行分片任务期间定期续约任务租约，避免长任务超过 job_ttl 后被其它副本重复领取
+
+        产出 JobLease；续约失败即视为租约丢失，停止续约，任务应随即中止且不得标记完成。
+        """
+        lease = JobLease(self.store, f"job:{run_id}:{shard}", self.replica_id)
+        stop = threading.Event()
+
+        def _renew():
+            while not stop.wait(self.job_ttl / 3):
+                if not self.store.acquire(lease.name, self.replica_id, self.job_ttl):
+                    logger.error(f"副本 {self.replica_id} 任务租约续约失败，租约已丢失: {run_id}/{shard}")
+                    lease._mark_lost()
+                    return
+
+        thread = threading.Thread(target=_renew, name=f"lease-{shard}", daemon=True)
+        thread.start()
+        try:
+            yield lease
+        finally:
+            stop.set()
+            thread.join()
+
+    def claim_each(self, run_id: str, shards: Iterable[str]) -> Iterator[str]:
+        """
+        依次尝试领取分片，逐个产出领取成功的分片
+
+        各副本从不同位置开始遍历，减少对同一分片的争抢。
+        调用方处理完每个分片后应调用 finish()。
+        """
+        shards = list(shards)
+        if not shards:
+            return
+        start = zlib.crc32(self.replica_id.encode("utf-8")) % len(shards)
+        for shard in shards[start:] + shards[:start]:
+            if self.claim(run_id, shard):
+                logger.info(f"副本 {self.replica_id} 领取任务: {run_id}/{shard}")
+                yield shard
@@ -4,22 +4,33 @@ import os
 import requests
 import json
 import time
+import hashlib
 from typing import Optional
 from loguru import logger
 
+from response_cache import ResponseCache
+from log_config import truncate
+
 class ImageGenerator:
     """通义万相图像生成"""
     
     def __init__(self):
         self.api_key = os.getenv("DASHSCOPE_API_KEY")
         self.base_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/multimodal-generation/generation"
+        self.model = "qwen-image-plus"
+        self.cache = ResponseCache()
+        # 缓存模式下生成的图片下载到本地，避免回放已过期的URL
+        self.image_dir = os.path.join(os.path.dirname(self.cache.path) or ".", "images")
     
     def generate(self, prompt: str) -> Optional[str]:
         """
         根据提示词生成图片
         
         Returns:
-            图片URL
+            图片URL；开启缓存时为本地图片路径
+            
+        Raises:
+            CacheMiss: replay 模式下缓存未命中
         """
         headers = {
             "Content-Type": "application/json",
@@ -27,7 +38,7 @@ class ImageGenerator:
         }
         
         data = {
-            "model": "qwen-image-plus",
+            "model": self.model,
             "input": {
                 "messages": [
                     {
@@ -45,6 +56,38 @@ class ImageGenerator:
             }
         }
         
+        if not self.cache.enabled:
+            return self._request(headers, data)
+        
+        # 开启缓存时按 模型+提示词+参数 录制/回放本地图片路径（通义万相返回的URL有有效期）
+        return self.cache.fetch(
+            "wanx.image", self.model, prompt, data["parameters"],
+            lambda: self._download(self._request(headers, data)),
+            validate=os.path.exists
+        )
+    
+    def _download(self, image_url: Optional[str]) -> Optional[str]:
+        """下载图片到缓存目录，返回本地路径"""
+        if not image_url:
+            return None
+        try:
+            resp = requests.get(image_url, timeout=30)
+            if resp.status_code != 200:
+                logger.error(f"图片下载失败，状态码 {resp.status_code}: {image_url}")
+                return None
+        except Exception as e:
+            logger.error(f"图片下载异常: {e}")
+            return None
+        
+        ext = ".png" if resp.content.startswith(b"\x89PNG") else ".jpg"
+        os.makedirs(self.image_dir, exist_ok=True)
+        path = os.path.join(self.image_dir, hashlib.sha256(resp.content).hexdigest() + ext)
+        with open(path, "wb") as f:
+            f.write(resp.content)
+        return os.path.abspath(path)
+    
+    def _request(self, headers: dict, data: dict) -> Optional[str]:
+        """调用通义万相接口，返回图片URL"""
         try:
             resp = requests.post(self.base_url, headers=headers, json=data, timeout=60)
             result = resp.json()
@@ -55,7 +98,7 @@ class ImageGenerator:
                 logger.success(f"图片生成成功: {image_url}")
                 return image_url
             else:
-                logger.error(f"图片生成失败: {result}")
+                logger.error(f"图片生成失败: {truncate(result)}")
                 return None
         except Exception as e:
             logger.error(f"图片生成异常: {e}")
@@ -0,0 +1,110 @@
+# 日志配置（文本 / 结构化JSON）
+# log_config.py
+import os
+import json
+import uuid
+import random
+import functools
+import traceback
+from contextlib import contextmanager
+from typing import Any, Optional
+from loguru import logger
+
+
+def _max_payload_chars() -> int:
+    """日志中单条载荷的默认最大长度（调用时读取，load_dotenv 在导入之后执行也能生效）"""
+    return int(os.getenv("LOG_MAX_PAYLOAD_CHARS", "500"))
+
+
+def truncate(payload: Any, limit: int = None) -> str:
+    """将载荷转为字符串并截断，避免在热路径中记录完整的上游响应"""
+    limit = limit or _max_payload_chars()
+    text = payload if isinstance(payload, str) else str(payload)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(已截断，共{len(text)}字符)"
+
+
+def _json_formatter(record) -> str:
+    """将日志记录序列化为单行JSON"""
+    extra = {k: v for k, v in record["extra"].items() if not k.startswith("_")}
+    max_chars = _max_payload_chars()
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": truncate(record["message"], max_chars * 4),
+        "job_id": extra.pop("job_id", None),
+        "account_id": extra.pop("account_id", None),
+        "module": record["module"],
+        "function": record["function"],
+        "line": record["line"],
+    }
+    if extra:
+        entry["extra"] = {k: truncate(v, max_chars) for k, v in extra.items()}
+    if record["exception"] is not None:
+        exc_type, exc_value, exc_tb = record["exception"]
+        entry["exception"] = f"{exc_type.__name__ if exc_type else ''}: {exc_value}"
+        # 保留完整堆栈，过长时保留末尾（最接近出错位置）
+        stack = "".join(traceback.format_exception(exc_type, exc_value, exc_tb))
+        limit = max_chars * 8
+        entry["traceback"] = stack if len(stack) <= limit else f"...(已截断，共{len(stack)}字符)\n{stack[-limit:]}"
+    record["extra"]["_json"] = json.dumps(entry, ensure_ascii=False)
+    return "{extra[_json]}\n"
+
+
+def _make_sampling_filter(rate: float):
+    """DEBUG 级别日志按比例采样，其它级别全部保留"""
+    def _filter(record) -> bool:
+        if record["level"].no > logger.level("DEBUG").no:
+            return True
+        return rate >= 1.0 or random.random() < rate
+    return _filter
+
+
+def setup_logging(path: str, level: str = "DEBUG", rotation: str = "1 day",
+                  retention: str = "7 days"):
+    """
+    添加日志文件输出
+
+    LOG_FORMAT=text（默认）时保持原有的同步文本日志；
+    LOG_FORMAT=json 时改为异步写入的JSON Lines日志（扩展名 .jsonl），
+    并按 LOG_DEBUG_SAMPLE_RATE 对 DEBUG 日志采样。
+
+    Args:
+        path: 文本日志路径，支持 loguru 的时间占位符
+    """
+    log_format = os.getenv("LOG_FORMAT", "text").strip().lower()
+
+    if log_format != "json":
+        logger.add(path, rotation=rotation, retention=retention, level=level)
+        return
+
+    sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+    json_path = os.path.splitext(path)[0] + ".jsonl"
+    logger.add(
+        json_path,
+        format=_json_formatter,
+        level=level,
+        rotation=rotation,
+        retention=retention,
+        filter=_make_sampling_filter(sample_rate),
+        enqueue=True,  # 后台线程写盘，批量任务不阻塞在磁盘IO上
+    )
+
+
+@contextmanager
+def job_context(job_id: Optional[str] = None, account_id: Optional[str] = None):
+    """为当前任务内的所有日志附加 job_id / account_id，便于按任务检索"""
+    job_id = job_id or uuid.uuid4().hex[:12]
+    account_id = account_id or os.getenv("WECHAT_APP_ID")
+    with logger.contextualize(job_id=job_id, account_id=account_id):
+        yield job_id
+
+
+def with_job_context(func):
+    """装饰器：每次调用都在新的 job_context 中执行"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with job_context():
+            return func(*args, **kwargs)
+    return wrapper
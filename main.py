@@ -4,70 +4,105 @@ from fastapi import FastAPI, BackgroundTasks
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import os
+import threading
 from datetime import datetime
 from loguru import logger
 
 from qwen_client import QwenClient
-from wechat_client import WeChatClient
+from wechat_client import WeChatClient, load_accounts
 from image_gen import ImageGenerator
-from topic_generator import TopicGenerator
+from log_config import setup_logging, job_context
+from publish_flow import build_publish_pipeline
+from publish_tracker import PublishTracker
+from coordination import Coordinator, SQLiteCoordinationStore, JobLease
 
 # 配置日志
-logger.add("logs/article_{time}.log", rotation="1 day", retention="7 days")
+setup_logging("logs/article_{time}.log")
 
 # 初始化客户端
 qwen = QwenClient()
-wechat = WeChatClient()
 image_gen = ImageGenerator()
+wechat_clients = {
+    app_id: WeChatClient(app_id, app_secret) for app_id, app_secret in load_accounts()
+}
 
-def publish_daily_article():
-    """每日发布任务"""
-    logger.info("开始执行每日文章生成任务")
-    
-    try:
-        # 1. 生成主题
-        topic = TopicGenerator.generate("AI软件测试")
-        logger.info(f"今日主题: {topic}")
-        
-        # 2. 生成文章内容
-        article = qwen.generate_article(topic)
-        
-        # 3. 生成配图提示词（如果文章中没有，则使用默认）
-        image_prompt = article.get("image_prompt", 
-                                  "AI software testing, futuristic technology, blue tone, 4k")
-        
-        # 4. 生成配图
-        image_url = image_gen.generate(image_prompt)
-        if not image_url:
-            # 使用默认配图（可选：从备用图库选择）
-            logger.warning("图片生成失败，使用默认图片")
-            image_url = "https://example.com/default_cover.jpg"
-        
-        # 5. 上传配图到公众号
-        media_id = wechat.upload_image(image_url)
-        if not media_id:
-            logger.error("配图上传失败，中止发布")
-            return
-        
-        # 6. 创建草稿/发布
-        save_to_draft = os.getenv("SAVE_TO_DRAFT", "true").lower() == "true"
+# 多副本协调：主节点负责定时触发，各副本按账号领取任务
+coordinator = Coordinator(SQLiteCoordinationStore())
+_work_lock = threading.Lock()
+
+# 所有账号共用的发布状态跟踪器，由调度器定期轮询，发布任务提交后不阻塞
+publish_tracker = PublishTracker()
+
+def publish_daily_article(wechat: WeChatClient, lease: JobLease = None):
+    """单个公众号的每日发布任务（lease 为协调领取时的任务租约，丢失后不再提交草稿/发布）"""
+    with job_context(account_id=wechat.app_id):
+        logger.info("开始执行每日文章生成任务")
         
-        if save_to_draft:
-            success = wechat.add_draft(article, media_id)
-            if success:
-                logger.info(f"文章已保存到草稿箱: {article['title']}")
+        try:
+            # 主题 -> 文章 -> 配图/预处理（并行） -> 上传 -> 草稿 [-> 发布]
+            save_to_draft = os.getenv("SAVE_TO_DRAFT", "true").lower() == "true"
+            
+            tracker = None if save_to_draft else publish_tracker
+            result = build_publish_pipeline(qwen, wechat, image_gen, tracker, lease).run()
+            
+            if result.ok:
+                logger.success("每日文章任务执行完成")
             else:
-                logger.error("草稿保存失败")
-        else:
-            # 直接发布（需要额外调用发布接口）
-            logger.warning("直接发布功能暂未实现，已保存为草稿")
-            wechat.add_draft(article, media_id)
-        
-        logger.success("每日文章任务执行完成")
-        
-    except Exception as e:
-        logger.error(f"任务执行失败: {e}", exc_info=True)
+                logger.error(f"每日文章任务失败: {'; '.join(str(e) for e in result.errors.values())}")
+            
+        except Exception as e:
+            logger.exception(f"任务执行失败: {e}")
+
+
+def publish_all_accounts():
+    """不经协调，依次为所有账号发布（手动触发）"""
+    for wechat in wechat_clients.values():
+        publish_daily_article(wechat)
+
+
+def process_claimed_accounts():
+    """领取并执行当日已开启、尚未完成的账号任务"""
+    run_id = datetime.now().strftime("%Y%m%d")
+    if not coordinator.run_is_open(run_id):
+        return
+    # 同一副本内定时触发与轮询可能重叠，只允许一个在领取任务
+    if not _work_lock.acquire(blocking=False):
+        return
+    try:
+        for app_id in coordinator.claim_each(run_id, list(wechat_clients)):
+            lease = None
+            try:
+                with coordinator.heartbeat(run_id, app_id) as lease:
+                    publish_daily_article(wechat_clients[app_id], lease)
+            finally:
+                # 失败也标记完成，避免各副本反复重试付费生成；
+                # 租约已丢失时其它副本可能已接手，不能标记完成
+                if lease is not None and lease.held:
+                    coordinator.finish(run_id, app_id)
+                else:
+                    logger.error(f"任务租约已丢失，不标记完成: {run_id}/{app_id}")
+    finally:
+        _work_lock.release()
+
+
+def daily_article_trigger():
+    """定时触发：仅主节点开启当日任务，所有副本随后分片执行"""
+    if not coordinator.is_leader():
+        logger.info(f"副本 {coordinator.replica_id} 非主节点，跳过定时触发")
+        return
+    
+    run_id = datetime.now().strftime("%Y%m%d")
+    if coordinator.open_run(run_id):
+        logger.info(f"主节点 {coordinator.replica_id} 开启当日任务: {run_id}，账号数 {len(wechat_clients)}")
+    process_claimed_accounts()
+
+
+def coordination_tick():
+    """定期续约主节点租约，并领取其它副本未完成的任务"""
+    coordinator.is_leader()
+    process_claimed_accounts()
 
 
 # 调度器
@@ -81,11 +116,25 @@ async def lifespan(app: FastAPI):
     hour, minute = map(int, publish_time.split(":"))
     
     scheduler.add_job(
-        publish_daily_article,
+        daily_article_trigger,
         trigger=CronTrigger(hour=hour, minute=minute),
         id="daily_article_publish",
         replace_existing=True
     )
+    scheduler.add_job(
+        coordination_tick,
+        trigger=IntervalTrigger(seconds=int(os.getenv("COORD_POLL_INTERVAL", "30"))),
+        id="coordination_tick",
+        replace_existing=True,
+        max_instances=1
+    )
+    scheduler.add_job(
+        publish_tracker.poll_due,
+        trigger=IntervalTrigger(seconds=int(os.getenv("PUBLISH_POLL_TICK", "2"))),
+        id="publish_status_poll",
+        replace_existing=True,
+        max_instances=1
+    )
     scheduler.start()
     
     logger.info(f"定时任务已启动，每日 {publish_time} 执行")
@@ -95,6 +144,7 @@ async def lifespan(app: FastAPI):
     # 关闭时停止调度器
     scheduler.shutdown()
     logger.info("应用关闭，调度器已停止")
+    logger.complete()
 
 
 # 创建FastAPI应用
@@ -119,19 +169,24 @@ async def root():
 @app.post("/trigger")
 async def trigger_publish(background_tasks: BackgroundTasks):
     """手动触发发布（用于测试）"""
-    background_tasks.add_task(publish_daily_article)
+    background_tasks.add_task(publish_all_accounts)
     return {"message": "发布任务已触发"}
 
 
 @app.get("/health")
-async def health():
-    """详细健康检查"""
+def health():
+    """详细健康检查（查询协调存储为阻塞IO，使用普通函数交由线程池执行）"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "components": {
             "qwen_api": "configured" if os.getenv("DASHSCOPE_API_KEY") else "missing",
-            "wechat_api": "configured" if os.getenv("WECHAT_APP_ID") else "missing"
+            "wechat_api": "configured" if all(wechat_clients) else "missing"
+        },
+        "replica": {
+            "id": coordinator.replica_id,
+            "leader": coordinator.leader(),
+            "accounts": len(wechat_clients)
         }
     }
 
@@ -0,0 +1,226 @@
+# 阶段流水线（DAG + 可插拔执行器）
+# pipeline.py
+import os
+import time
+import asyncio
+import inspect
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from loguru import logger
+
+
+class PipelineAbort(Exception):
+    """阶段主动中止流水线（下游阶段全部跳过）"""
+
+
+class Stage:
+    """流水线阶段"""
+
+    def __init__(self, name: str, func: Callable[[Dict[str, Any]], Any], deps: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+
+
+class PipelineResult:
+    """流水线执行结果"""
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.errors: Dict[str, Exception] = {}
+        self.timings: Dict[str, float] = {}
+        self.skipped: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and not self.skipped
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.values.get(name, default)
+
+    def summary(self) -> str:
+        return ", ".join(f"{name}={elapsed:.2f}s" for name, elapsed in self.timings.items())
+
+
+def _call_stage(func: Callable, inputs: Dict[str, Any]):
+    """执行单个阶段并计时（模块级函数，便于进程池序列化）"""
+    start = time.perf_counter()
+    try:
+        return func(inputs), None, time.perf_counter() - start
+    except Exception as e:
+        return None, e, time.perf_counter() - start
+
+
+def map_concurrently(func: Callable, items: list, max_workers: int) -> list:
+    """在线程池中对 items 并发调用 func，保留调用方的日志上下文"""
+    if not items:
+        return []
+    contexts = [contextvars.copy_context() for _ in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(lambda ctx, item: ctx.run(func, item), contexts, items))
+
+
+class Pipeline:
+    """
+    由阶段组成的有向无环图
+
+    每个阶段是 func(inputs) -> value，inputs 为其依赖阶段的输出 {阶段名: 值}。
+    依赖就绪的阶段会被提交给执行器，互不依赖的阶段自动并行。
+    某阶段失败或抛出 PipelineAbort 时，其下游阶段全部跳过。
+
+    执行器（参数 executor 或环境变量 PIPELINE_EXECUTOR）：
+        inline   按添加顺序在当前线程依次执行
+        thread   线程池（默认）
+        process  进程池，要求阶段函数及其输入输出可被 pickle
+        asyncio  事件循环，协程阶段直接 await，普通函数放入默认线程池
+    """
+
+    EXECUTORS = ("inline", "thread", "process", "asyncio")
+
+    def __init__(self, name: str = "pipeline", executors: Iterable[str] = EXECUTORS):
+        self.name = name
+        # 本流水线支持的执行器（阶段不可序列化时应排除 process）
+        self.executors = tuple(executors)
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, func: Callable[[Dict[str, Any]], Any], deps: Iterable[str] = ()) -> "Pipeline":
+        """添加阶段，依赖必须是已添加的阶段（保证无环）"""
+        if name in self.stages:
+            raise ValueError(f"阶段重复: {name}")
+        deps = list(deps)
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"阶段 {name} 依赖未知阶段: {dep}")
+        self.stages[name] = Stage(name, func, deps)
+        return self
+
+    def stage(self, name: str, deps: Iterable[str] = ()):
+        """装饰器形式的 add"""
+        def decorator(func):
+            self.add(name, func, deps)
+            return func
+        return decorator
+
+    def run(self, executor: str = None, max_workers: Optional[int] = None) -> PipelineResult:
+        """执行流水线"""
+        executor = (executor or os.getenv("PIPELINE_EXECUTOR", "thread")).strip().lower()
+        if executor not in self.EXECUTORS:
+            raise ValueError(f"未知的执行器: {executor}")
+        if executor not in self.executors:
+            raise ValueError(f"流水线 {self.name} 不支持执行器: {executor}，可选: {', '.join(self.executors)}")
+
+        result = PipelineResult()
+        start = time.perf_counter()
+
+        if executor == "inline":
+            self._run_inline(result)
+        elif executor == "asyncio":
+            asyncio.run(self._run_asyncio(result))
+        else:
+            pool_cls = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+            with pool_cls(max_workers=max_workers) as pool:
+                self._run_pool(pool, result, copy_context=(executor == "thread"))
+
+        logger.info(
+            f"流水线 {self.name} 执行{'完成' if result.ok else '结束'}"
+            f"（{executor}，总耗时 {time.perf_counter() - start:.2f}s）: {result.summary()}"
+        )
+        return result
+
+    def _inputs(self, stage: Stage, result: PipelineResult) -> Dict[str, Any]:
+        return {dep: result.values[dep] for dep in stage.deps}
+
+    def _blocked(self, stage: Stage, result: PipelineResult) -> bool:
+        return any(dep in result.errors or dep in result.skipped for dep in stage.deps)
+
+    def _ready(self, stage: Stage, result: PipelineResult) -> bool:
+        return all(dep in result.values for dep in stage.deps)
+
+    def _record(self, result: PipelineResult, name: str, value: Any, error: Optional[Exception], elapsed: float):
+        result.timings[name] = elapsed
+        if error is None:
+            result.values[name] = value
+        elif isinstance(error, PipelineAbort):
+            result.errors[name] = error
+            logger.warning(f"阶段 {name} 中止流水线: {error}")
+        else:
+            result.errors[name] = error
+            logger.opt(exception=error).error(f"阶段 {name} 执行失败: {error}")
+
+    def _record_outcome(self, result: PipelineResult, future, name: str, submitted_at: float):
+        """记录已完成的 future；执行器层面的异常（如进程池序列化失败）记为该阶段失败"""
+        try:
+            outcome = future.result()
+        except Exception as e:
+            outcome = (None, e, time.perf_counter() - submitted_at)
+        self._record(result, name, *outcome)
+
+    def _schedule(self, pending: Dict[str, Stage], result: PipelineResult) -> List[Stage]:
+        """取出所有依赖已就绪的阶段，并跳过上游失败的阶段"""
+        ready = []
+        for name in list(pending):
+            stage = pending[name]
+            if self._blocked(stage, result):
+                result.skipped.append(name)
+                del pending[name]
+            elif self._ready(stage, result):
+                ready.append(stage)
+                del pending[name]
+        return ready
+
+    def _run_inline(self, result: PipelineResult):
+        for stage in self.stages.values():
+            if self._blocked(stage, result):
+                result.skipped.append(stage.name)
+                continue
+            self._record(result, stage.name, *_call_stage(stage.func, self._inputs(stage, result)))
+
+    def _run_pool(self, pool, result: PipelineResult, copy_context: bool):
+        pending = dict(self.stages)
+        running = {}
+        while pending or running:
+            for stage in self._schedule(pending, result):
+                inputs = self._inputs(stage, result)
+                if copy_context:
+                    # 线程不会继承 contextvars，需显式复制以保留日志上下文
+                    future = pool.submit(contextvars.copy_context().run, _call_stage, stage.func, inputs)
+                else:
+                    future = pool.submit(_call_stage, stage.func, inputs)
+                running[future] = (stage.name, time.perf_counter())
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._record_outcome(result, future, *running.pop(future))
+
+    async def _run_asyncio(self, result: PipelineResult):
+        loop = asyncio.get_running_loop()
+        pending = dict(self.stages)
+        running = {}
+        while pending or running:
+            for stage in self._schedule(pending, result):
+                inputs = self._inputs(stage, result)
+                if inspect.iscoroutinefunction(stage.func):
+                    task = asyncio.ensure_future(self._call_async(stage.func, inputs))
+                else:
+                    task = loop.run_in_executor(
+                        None, contextvars.copy_context().run, _call_stage, stage.func, inputs
+                    )
+                running[task] = (stage.name, time.perf_counter())
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                self._record_outcome(result, task, *running.pop(task))
+
+    @staticmethod
+    async def _call_async(func: Callable, inputs: Dict[str, Any]):
+        start = time.perf_counter()
+        try:
+            return await func(inputs), None, time.perf_counter() - start
+        except Exception as e:
+            return None, e, time.perf_counter() - start
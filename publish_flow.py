@@ -0,0 +1,339 @@
+# 文章发布流程（main.py 与 run_publisher.py 共用）
+# publish_flow.py
+import os
+import time
+import json
+import functools
+from datetime import datetime
+from typing import Any, Dict, Optional
+from loguru import logger
+import requests
+
+from pipeline import Pipeline, PipelineAbort
+from response_cache import ResponseCache, CacheMiss
+from topic_generator import TopicGenerator
+from log_config import truncate
+from publish_tracker import PublishTracker
+from content_optimizer import ContentOptimizer, ContentTooLarge
+from coordination import JobLease
+
+DEFAULT_IMAGE_PROMPT = "AI software testing, futuristic technology, blue tone, 4k"
+
+# 公众号图文字段长度限制
+MAX_TITLE_CHARS = 32
+MAX_DIGEST_CHARS = 120
+
+
+def get_local_fallback_image() -> str:
+    """获取本地备用图片的绝对路径"""
+    # 获取当前脚本所在目录
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    local_path = os.path.join(base_dir, "default_cover.jpg")
+
+    if os.path.exists(local_path):
+        return local_path
+    else:
+        logger.warning(f"本地备用图未找到: {local_path}，请确保该文件存在以防网络完全不可用。")
+        return None
+
+def extract_image_url_from_result(image_result) -> str:
+    """从AI绘图返回的结果中提取图片URL"""
+    if not image_result:
+        return None
+
+    # 情况1: 直接返回了URL字符串
+    if isinstance(image_result, str):
+        if image_result.startswith(('http://', 'https://')):
+            return image_result
+        # 情况2: 可能是JSON字符串
+        elif image_result.startswith('{'):
+            try:
+                data = json.loads(image_result)
+                # 尝试多种可能的路径提取URL
+                if 'output' in data and 'choices' in data['output']:
+                    for choice in data['output']['choices']:
+                        if 'message' in choice and 'content' in choice['message']:
+                            content = choice['message']['content']
+                            if isinstance(content, list):
+                                for item in content:
+                                    if isinstance(item, dict) and 'image' in item:
+                                        return item['image']
+                            elif isinstance(content, dict) and 'image' in content:
+                                return content['image']
+                # 其他可能的格式
+                elif 'data' in data and isinstance(data['data'], dict) and 'url' in data['data']:
+                    return data['data']['url']
+                elif 'url' in data:
+                    return data['url']
+            except Exception as e:
+                logger.debug(f"JSON解析失败: {e}")
+
+    # 情况3: 直接返回了字典
+    elif isinstance(image_result, dict):
+        # 尝试多种可能的路径
+        if 'output' in image_result and 'choices' in image_result['output']:
+            for choice in image_result['output']['choices']:
+                if 'message' in choice and 'content' in choice['message']:
+                    content = choice['message']['content']
+                    if isinstance(content, list):
+                        for item in content:
+                            if isinstance(item, dict) and 'image' in item:
+                                return item['image']
+        elif 'data' in image_result and isinstance(image_result['data'], dict) and 'url' in image_result['data']:
+            return image_result['data']['url']
+        elif 'url' in image_result:
+            return image_result['url']
+
+    return None
+
+def upload_local_image(wechat_client, image_path: str) -> str:
+    """上传本地图片到微信"""
+    token = wechat_client._get_access_token()
+    if not token:
+        logger.error("无法获取 Token，无法上传本地图片")
+        return None
+
+    try:
+        with open(image_path, 'rb') as f:
+            files = {'media': ('cover.jpg', f.read(), 'image/jpeg')}
+        url = "https://api.weixin.qq.com/cgi-bin/material/add_material"
+        params = {"access_token": token, "type": "image"}
+        resp = requests.post(url, params=params, files=files, timeout=30)
+        data = resp.json()
+        if "media_id" in data:
+            media_id = data["media_id"]
+            logger.success(f"本地图片上传成功，media_id: {media_id}")
+            return media_id
+        else:
+            logger.error(f"本地图片上传失败: {truncate(data)}")
+            return None
+    except Exception as e:
+        logger.error(f"本地图片上传异常: {e}")
+        return None
+
+def save_local_draft(article: Dict[str, Any], image_url: str = None, image_path: str = None) -> str:
+    """图片上传失败时将文章保存为本地 Markdown 草稿"""
+    draft_dir = os.path.join(os.getcwd(), 'drafts')
+    os.makedirs(draft_dir, exist_ok=True)
+
+    # 生成安全的文件名
+    safe_title = "".join(c for c in article['title'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    draft_file = os.path.join(draft_dir, f"{safe_title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md")
+
+    with open(draft_file, 'w', encoding='utf-8') as f:
+        f.write(f"# {article['title']}\n\n")
+        if image_url:
+            f.write(f"![cover]({image_url})\n\n")
+        elif image_path:
+            f.write(f"![cover](file://{image_path})\n\n")
+        f.write(article['content'])
+
+    logger.success(f"文章已保存到本地草稿: {draft_file}")
+    return draft_file
+
+
+# ---------------- 流水线阶段 ----------------
+
+def _stage_topic(wechat, inputs: Dict[str, Any]) -> str:
+    """阶段 topic: 生成文章主题；开启缓存时同一账号同一轮次（默认按天）复用主题，保证重跑命中缓存"""
+    run_key = os.getenv("LLM_CACHE_RUN_KEY") or datetime.now().strftime("%Y%m%d")
+    try:
+        topic = ResponseCache().fetch(
+            "topic", "TopicGenerator", f"{run_key}:{wechat.app_id}", None,
+            lambda: TopicGenerator.generate("AI软件测试")
+        )
+    except CacheMiss as e:
+        raise PipelineAbort(f"回放模式下主题未录制: {e}")
+    logger.info(f"今日主题: {topic}")
+    return topic
+
+def _stage_article(qwen, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """阶段 article: 生成文章内容"""
+    try:
+        article = qwen.generate_article(inputs["topic"])
+    except CacheMiss as e:
+        raise PipelineAbort(f"回放模式下文章未录制: {e}")
+
+    if not article or not article.get("title"):
+        raise PipelineAbort("文章生成失败，内容为空")
+
+    logger.success(f"文章生成成功: {article['title']}")
+    return article
+
+def _stage_image(image_gen, inputs: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """阶段 image: 准备封面图，依次尝试 AI 生成、网络备用图、本地备用图"""
+    image_url = None
+    image_path = None
+
+    # 尝试方案 A: AI 生成
+    image_prompt = inputs["article"].get("image_prompt", DEFAULT_IMAGE_PROMPT)
+    logger.info(f"正在调用 AI 绘图: {image_prompt[:40]}...")
+
+    try:
+        image_result = image_gen.generate(image_prompt)
+    except CacheMiss as e:
+        raise PipelineAbort(f"回放模式下配图未录制: {e}")
+
+    if isinstance(image_result, str) and os.path.isfile(image_result):
+        # 缓存模式下返回的是本地图片
+        logger.success(f"AI 绘图成功，使用本地图片: {image_result}")
+        return {"url": None, "path": image_result}
+
+    image_url = extract_image_url_from_result(image_result)
+
+    if image_url:
+        logger.success(f"AI 绘图成功，获取到图片URL: {image_url}")
+    else:
+        logger.warning(f"AI 绘图未返回有效图片URL，返回内容: {str(image_result)[:100]}...")
+
+    # 尝试方案 B: 网络备用图 (如果 AI 生成失败)
+    if not image_url:
+        logger.warning("AI 绘图失败，尝试使用网络备用图 (picsum)...")
+        # 加时间戳防止缓存
+        fallback_url = f"https://picsum.photos/1024/1024?random={int(time.time())}"
+        try:
+            # 先测试能否连通
+            head_resp = requests.head(fallback_url, timeout=5, allow_redirects=True)
+            if head_resp.status_code == 200:
+                image_url = fallback_url
+                logger.info(f"网络备用图可用: {fallback_url}")
+            else:
+                logger.warning(f"网络备用图连接失败，状态码: {head_resp.status_code}")
+        except Exception as e:
+            logger.warning(f"无法访问网络备用图: {e}")
+
+    # 尝试方案 C: 本地备用图 (如果网络也挂了)
+    if not image_url:
+        logger.error("所有在线图片源均不可用，切换至本地备用模式...")
+        image_path = get_local_fallback_image()
+        if not image_path:
+            raise PipelineAbort("致命错误：无可用图片（在线离线均失败）")
+        logger.success(f"已加载本地图片: {image_path}")
+
+    return {"url": image_url, "path": image_path}
+
+def _stage_preprocess(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """阶段 preprocess: 按公众号字段限制整理文章（与配图阶段并行）"""
+    article = dict(inputs["article"])
+    article["content"] = (article.get("content") or "").strip()
+    if not article["content"]:
+        raise PipelineAbort("文章正文为空")
+
+    if len(article["title"]) > MAX_TITLE_CHARS:
+        logger.warning(f"标题超过{MAX_TITLE_CHARS}字，已截断: {article['title']}")
+        article["title"] = article["title"][:MAX_TITLE_CHARS]
+
+    summary = article.get("summary") or article["title"]
+    article["summary"] = summary[:MAX_DIGEST_CHARS]
+    return article
+
+def _stage_content(wechat, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """阶段 content: 转存正文图片、压缩HTML并控制在公众号体积限制内"""
+    article = dict(inputs["preprocess"])
+    try:
+        article["content"] = ContentOptimizer(wechat).optimize(article["content"])
+    except ContentTooLarge as e:
+        raise PipelineAbort(str(e))
+    return article
+
+def _stage_upload(wechat, inputs: Dict[str, Any]) -> Optional[str]:
+    """阶段 upload: 上传封面图为永久素材，返回 media_id（失败返回 None）"""
+    image_url = inputs["image"]["url"]
+    image_path = inputs["image"]["path"]
+    media_id = None
+
+    if image_url:
+        # 使用URL上传
+        logger.info(f"使用图片URL: {image_url}")
+        media_id = wechat.upload_permanent_image(image_url)
+        if not media_id:
+            # URL上传失败，尝试带浏览器UA下载后上传
+            logger.warning("尝试下载图片后上传...")
+            try:
+                img_resp = requests.get(image_url, timeout=30, headers={
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                })
+                if img_resp.status_code == 200:
+                    temp_path = f"/tmp/temp_cover_{int(time.time())}.jpg"
+                    with open(temp_path, 'wb') as f:
+                        f.write(img_resp.content)
+                    try:
+                        media_id = upload_local_image(wechat, temp_path)
+                    finally:
+                        try:
+                            os.remove(temp_path)
+                        except OSError:
+                            pass
+                else:
+                    logger.error(f"下载图片失败，状态码: {img_resp.status_code}")
+            except Exception as e:
+                logger.error(f"下载并上传图片失败: {e}")
+    elif image_path:
+        # 上传本地图片
+        logger.info(f"使用本地图片: {image_path}")
+        media_id = upload_local_image(wechat, image_path)
+
+    return media_id
+
+def _check_lease(lease: Optional[JobLease]):
+    """多副本运行时，任务租约丢失后其它副本可能已接手，不能再提交草稿或发布"""
+    if lease is not None and not lease.held:
+        raise PipelineAbort("任务租约已丢失，由接手的副本继续处理")
+
+def _stage_draft(wechat, lease: Optional[JobLease], inputs: Dict[str, Any]) -> str:
+    """阶段 draft: 创建公众号草稿，返回草稿 media_id；封面上传失败时保存本地草稿"""
+    article = inputs["content"]
+    media_id = inputs["upload"]
+
+    if not media_id:
+        logger.error("图片上传最终失败，无法继续发布。")
+        logger.warning("尝试保存文章到本地草稿...")
+        save_local_draft(article, inputs["image"]["url"], inputs["image"]["path"])
+        logger.info("在GitHub Actions中，此文件可作为artifact下载")
+        raise PipelineAbort("封面上传失败，文章已保存为本地草稿")
+
+    _check_lease(lease)
+    draft_media_id = wechat.add_draft(article, media_id)
+    if not draft_media_id:
+        raise PipelineAbort("草稿保存失败")
+
+    logger.success(f"文章已保存到草稿箱: {article['title']}")
+    return draft_media_id
+
+def _stage_publish(wechat, tracker: PublishTracker, lease: Optional[JobLease], inputs: Dict[str, Any]):
+    """阶段 publish: 提交草稿发布后立即返回，发布状态由批量层的 tracker 轮询"""
+    _check_lease(lease)
+    result = tracker.submit(wechat, [inputs["draft"]])[0]
+    if result.done:
+        raise PipelineAbort(f"文章发布失败: {result.error}")
+
+    logger.info(f"文章已提交发布，publish_id: {result.publish_id}")
+    return result
+
+
+def build_publish_pipeline(qwen, wechat, image_gen, tracker: PublishTracker = None,
+                           lease: JobLease = None) -> Pipeline:
+    """
+    构建发布流水线
+
+        topic -> article -> image -> upload -----------> draft [-> publish]
+                        \\-> preprocess -> content --/
+
+    阶段持有客户端实例，仅支持 inline / thread / asyncio 执行器。
+
+    Args:
+        tracker: 传入时在创建草稿后提交发布，由调用方通过 tracker.poll_due() 跟踪发布结果
+        lease: 多副本协调下的任务租约，创建草稿与提交发布前确认仍持有
+    """
+    # 阶段持有不可序列化的客户端（含线程锁、HTTP连接），不支持进程池
+    pipeline = Pipeline("publish", executors=("inline", "thread", "asyncio"))
+    pipeline.add("topic", functools.partial(_stage_topic, wechat))
+    pipeline.add("article", functools.partial(_stage_article, qwen), deps=["topic"])
+    pipeline.add("image", functools.partial(_stage_image, image_gen), deps=["article"])
+    pipeline.add("preprocess", _stage_preprocess, deps=["article"])
+    pipeline.add("content", functools.partial(_stage_content, wechat), deps=["preprocess"])
+    pipeline.add("upload", functools.partial(_stage_upload, wechat), deps=["image"])
+    pipeline.add("draft", functools.partial(_stage_draft, wechat, lease), deps=["content", "upload", "image"])
+    if tracker is not None:
+        pipeline.add("publish", functools.partial(_stage_publish, wechat, tracker, lease), deps=["draft"])
+    return pipeline
@@ -0,0 +1,191 @@
+# 草稿批量发布与状态轮询
+# publish_tracker.py
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from typing import Dict, Iterable, List, Optional, Tuple
+from loguru import logger
+
+from log_config import truncate
+from pipeline import map_concurrently
+
+
+class PublishResult:
+    """单篇草稿的发布结果"""
+
+    # freepublish/get 返回的 publish_status
+    STATUS_SUCCESS = 0
+    STATUS_PUBLISHING = 1
+    STATUS_TEXT = {
+        0: "发布成功",
+        1: "发布中",
+        2: "原创校验失败",
+        3: "常规失败",
+        4: "平台审核不通过",
+        5: "成功后用户删除所有文章",
+        6: "成功后系统封禁所有文章",
+    }
+
+    def __init__(self, media_id: str, publish_id: Optional[str] = None):
+        self.media_id = media_id
+        self.publish_id = publish_id
+        self.status: Optional[int] = None
+        self.article_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.polls = 0
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def success(self) -> bool:
+        return self.status == self.STATUS_SUCCESS
+
+    @property
+    def latency(self) -> Optional[float]:
+        """从提交到得到最终状态的耗时（秒）"""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.submitted_at
+
+    def _finish(self, status: Optional[int] = None, error: str = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+    def __repr__(self):
+        state = self.STATUS_TEXT.get(self.status, self.error or "未完成")
+        return f"PublishResult(media_id={self.media_id}, publish_id={self.publish_id}, {state})"
+
+
+class PublishTracker:
+    """
+    批量提交草稿发布并以非阻塞方式轮询状态（可跨多个公众号账号）
+
+    每个发布任务记录所属的 WeChatClient 和独立的下次查询时间，查询间隔从 min_interval 开始，
+    状态仍为"发布中"时按 backoff 倍数增长，上限 max_interval。
+    submit() 提交后立即返回；poll_due() 只查询已到期的任务（并发执行）并立即返回，
+    由外部调度循环反复调用；wait_all() 为阻塞式的便捷封装。线程安全。
+    """
+
+    def __init__(self, max_workers: int = None, min_interval: float = None,
+                 max_interval: float = None, backoff: float = 1.5, timeout: float = None):
+        self.max_workers = max_workers or int(os.getenv("PUBLISH_POLL_WORKERS", "8"))
+        self.min_interval = min_interval or float(os.getenv("PUBLISH_POLL_MIN_INTERVAL", "2"))
+        self.max_interval = max_interval or float(os.getenv("PUBLISH_POLL_MAX_INTERVAL", "60"))
+        self.backoff = backoff
+        self.timeout = timeout or float(os.getenv("PUBLISH_POLL_TIMEOUT", "1800"))
+
+        # 未完成的任务，键为 (app_id, publish_id)，值为 (客户端, 结果, 提交时的日志上下文)
+        self._pending: Dict[tuple, Tuple[object, PublishResult, contextvars.Context]] = {}
+        self._intervals: Dict[tuple, float] = {}
+        self._queue = []  # (下次查询时间, 序号, 键)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _schedule(self, key: tuple, delay: float):
+        heapq.heappush(self._queue, (time.time() + delay, next(self._seq), key))
+
+    def track(self, wechat, publish_id: str, media_id: str = None) -> PublishResult:
+        """跟踪已提交的发布任务；记录调用方的日志上下文，轮询结果在该上下文中记录"""
+        result = PublishResult(media_id, publish_id)
+        key = (wechat.app_id, publish_id)
+        context = contextvars.copy_context()
+        with self._lock:
+            self._pending[key] = (wechat, result, context)
+            self._intervals[key] = self.min_interval
+            self._schedule(key, self.min_interval)
+        return result
+
+    def submit(self, wechat, media_ids: Iterable[str]) -> List[PublishResult]:
+        """并发提交同一账号下多篇草稿的发布任务，不等待发布结果"""
+        media_ids = list(media_ids)
+        publish_ids = map_concurrently(wechat.submit_publish, media_ids, self.max_workers)
+
+        submitted = []
+        for media_id, publish_id in zip(media_ids, publish_ids):
+            if publish_id:
+                submitted.append(self.track(wechat, publish_id, media_id))
+            else:
+                result = PublishResult(media_id)
+                result._finish(error="发布任务提交失败")
+                submitted.append(result)
+        return submitted
+
+    def poll_due(self) -> List[PublishResult]:
+        """查询所有已到期的任务，返回本轮得到最终状态的结果"""
+        now = time.time()
+        due = []
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                key = heapq.heappop(self._queue)[2]
+                due.append((key, *self._pending[key]))
+        if not due:
+            return []
+
+        statuses = map_concurrently(
+            lambda item: item[1].get_publish_status(item[0][1]), due, self.max_workers
+        )
+
+        finished = []
+        with self._lock:
+            for (key, _, result, context), data in zip(due, statuses):
+                publish_id = result.publish_id
+                result.polls += 1
+
+                if data is not None and data.get("publish_status") != PublishResult.STATUS_PUBLISHING:
+                    status = data["publish_status"]
+                    if status == PublishResult.STATUS_SUCCESS:
+                        result.article_id = data.get("article_id")
+                        result._finish(status)
+                        context.run(logger.success, f"发布成功 publish_id={publish_id}，耗时 {result.latency:.1f}s")
+                    else:
+                        reason = PublishResult.STATUS_TEXT.get(status, f"未知状态 {status}")
+                        result._finish(status, reason)
+                        context.run(
+                            logger.error,
+                            f"发布失败 publish_id={publish_id}: {reason} {truncate(data.get('fail_idx', ''))}"
+                        )
+                elif now - result.submitted_at > self.timeout:
+                    result._finish(error="发布状态查询超时")
+                    context.run(logger.error, f"发布状态查询超时 publish_id={publish_id}")
+                else:
+                    # 仍在发布中（或查询失败），拉长下次查询间隔
+                    interval = min(self._intervals[key] * self.backoff, self.max_interval)
+                    self._intervals[key] = interval
+                    self._schedule(key, interval)
+                    continue
+
+                del self._pending[key]
+                del self._intervals[key]
+                finished.append(result)
+        return finished
+
+    def next_poll_in(self) -> Optional[float]:
+        """距离最近一次到期查询的秒数，无待查询任务返回 None"""
+        with self._lock:
+            if not self._queue:
+                return None
+            return max(0.0, self._queue[0][0] - time.time())
+
+    def wait_all(self) -> List[PublishResult]:
+        """轮询直到所有已跟踪任务得到最终状态，返回期间完成的结果"""
+        finished = []
+        while True:
+            finished += self.poll_due()
+            delay = self.next_poll_in()
+            if delay is None:
+                return finished
+            if delay:
+                time.sleep(delay)
@@ -1,10 +1,13 @@
 # 阿里千问客户端封装
 # qwen_client.py
 import os
+import json
 from openai import OpenAI
 from typing import Dict, Any
 from loguru import logger
 
+from response_cache import ResponseCache, CacheMiss
+
 class QwenClient:
     """阿里千问API客户端封装"""
     
@@ -16,6 +19,7 @@ class QwenClient:
             api_key=self.api_key,
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
         )
+        self.cache = ResponseCache()
         logger.info(f"千问客户端初始化完成，使用模型: {self.model}")
     
     def generate_article(self, topic: str = None) -> Dict[str, Any]:
@@ -45,33 +49,48 @@ class QwenClient:
 
         user_prompt = f"请撰写一篇关于「{topic or 'AI软件测试'}」的技术文章"
         
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        params = {
+            "response_format": {"type": "json_object"},
+            "temperature": 0.8
+        }
+        
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.8
+            # 开启缓存时按 模型+提示词+参数 录制/回放解析后的文章，只录制有效响应
+            article = self.cache.fetch(
+                "qwen.article", self.model, messages, params,
+                lambda: self._create_article(messages, params)
             )
             
-            result = completion.choices[0].message.content
-            # 解析JSON
-            import json
-            article = json.loads(result)
-            
             # 确保内容包含HTML标签，用于公众号排版
             article["content"] = self._format_content(article.get("content", ""))
             
             logger.success(f"文章生成成功: {article.get('title')}")
             return article
             
+        except CacheMiss:
+            # 回放模式不允许退回占位内容
+            raise
         except Exception as e:
             logger.error(f"文章生成失败: {e}")
             # 返回备用内容
             return self._get_fallback_article(topic)
     
+    def _create_article(self, messages: list, params: Dict[str, Any]) -> Dict[str, Any]:
+        """调用千问接口并解析JSON，响应无效时抛出 ValueError"""
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            **params
+        )
+        article = json.loads(completion.choices[0].message.content)
+        if not isinstance(article, dict) or not article.get("title") or not article.get("content"):
+            raise ValueError("返回的文章缺少标题或正文")
+        return article
+    
     def _format_content(self, content: str) -> str:
         """将纯文本转换为带HTML标签的公众号格式"""
         # 分割段落
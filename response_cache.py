@@ -0,0 +1,138 @@
+# 本地响应缓存（录制/回放）
+# response_cache.py
+import os
+import json
+import zlib
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Callable, Optional
+from loguru import logger
+
+
+class CacheMiss(Exception):
+    """回放模式下缓存未命中"""
+
+
+class ResponseCache:
+    """
+    付费接口（千问、通义万相）的本地录制/回放缓存
+
+    缓存键由 命名空间 + 模型 + 提示词 + 参数 的哈希组成，
+    响应以 zlib 压缩的 JSON 存放在 SQLite 中。
+
+    模式（环境变量 LLM_CACHE_MODE）：
+        off               不使用缓存（默认）
+        record            总是调用接口，并录制结果
+        replay            只从缓存读取，未命中时抛出 CacheMiss
+        replay_or_record  优先读缓存，未命中时调用接口并录制
+    """
+
+    OFF = "off"
+    RECORD = "record"
+    REPLAY = "replay"
+    REPLAY_OR_RECORD = "replay_or_record"
+    MODES = (OFF, RECORD, REPLAY, REPLAY_OR_RECORD)
+
+    def __init__(self, mode: str = None, path: str = None):
+        self.mode = (mode or os.getenv("LLM_CACHE_MODE", self.OFF)).strip().lower()
+        if self.mode not in self.MODES:
+            logger.warning(f"未知的缓存模式: {self.mode}，已关闭缓存")
+            self.mode = self.OFF
+        self.path = path or os.getenv("LLM_CACHE_PATH", "cache/responses.sqlite3")
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != self.OFF
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " namespace TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    @staticmethod
+    def make_key(namespace: str, model: str, prompt: Any, params: Any = None) -> str:
+        """根据命名空间、模型、提示词和参数生成缓存键"""
+        payload = json.dumps(
+            {"namespace": namespace, "model": model, "prompt": prompt, "params": params},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中返回 None"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            finally:
+                conn.close()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, key: str, namespace: str, model: str, value: Any):
+        """写入缓存（同键覆盖）"""
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, namespace, model, value, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, namespace, model, blob, time.time()),
+                )
+                conn.commit()
+            finally:
+                conn.close()
+
+    def fetch(self, namespace: str, model: str, prompt: Any, params: Any,
+              producer: Callable[[], Any], validate: Callable[[Any], bool] = None) -> Any:
+        """
+        按当前模式读取缓存或调用接口
+
+        Args:
+            producer: 实际调用接口的函数，返回值需可 JSON 序列化；
+                      返回 None 或抛出异常时不录制
+            validate: 校验缓存值是否仍可用（如本地文件是否存在），不可用视为未命中
+
+        Raises:
+            CacheMiss: replay 模式下未命中
+        """
+        if not self.enabled:
+            return producer()
+
+        key = self.make_key(namespace, model, prompt, params)
+
+        if self.mode in (self.REPLAY, self.REPLAY_OR_RECORD):
+            cached = self.get(key)
+            if cached is not None and validate is not None and not validate(cached):
+                logger.debug(f"缓存已失效: {namespace} {key[:12]}")
+                cached = None
+            if cached is not None:
+                logger.debug(f"缓存命中: {namespace} {key[:12]}")
+                return cached
+            if self.mode == self.REPLAY:
+                raise CacheMiss(f"缓存未命中: {namespace} {key[:12]}")
+
+        value = producer()
+        if value is not None:
+            self.put(key, namespace, model, value)
+            logger.debug(f"响应已录制: {namespace} {key[:12]}")
+        return value
@@ -0,0 +1,84 @@
+import base64
+
+import pytest
+
+from content_optimizer import ContentOptimizer, ContentTooLarge, enforce_budget, minify_html
+
+PNG = b"\x89PNG\r\n\x1a\nfake"
+PNG_URI = "data:image/png;base64," + base64.b64encode(PNG).decode()
+
+
+class _FakeWechat:
+    def __init__(self):
+        self.uploads = []
+
+    def upload_content_image(self, content, filename):
+        self.uploads.append((content, filename))
+        return f"https://mmbiz.qpic.cn/{len(self.uploads)}"
+
+
+def test_minify_keeps_space_between_inline_elements():
+    assert minify_html("<p><strong>Hello</strong> <em>world</em></p>") == \
+        "<p><strong>Hello</strong> <em>world</em></p>"
+
+
+def test_minify_drops_whitespace_between_blocks_and_comments():
+    html = "<!-- note -->\n<p>a   b</p>\n\n<h2>c</h2>\n<pre>  keep\n   this </pre>"
+    assert minify_html(html) == "<p>a b</p><h2>c</h2><pre>  keep\n   this </pre>"
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    monkeypatch.setenv("WECHAT_MAX_CONTENT_CHARS", "40")
+    monkeypatch.delenv("WECHAT_TRUNCATE_OVERSIZED", raising=False)
+
+
+def test_oversized_content_aborts_by_default(small_budget):
+    with pytest.raises(ContentTooLarge):
+        enforce_budget("<p>" + "x" * 50 + "</p>")
+
+
+def test_truncation_only_cuts_at_top_level(small_budget):
+    html = "<section><p>a</p><p>b</p></section><p>" + "x" * 50 + "</p>"
+    assert enforce_budget(html, truncate=True) == "<section><p>a</p><p>b</p></section>"
+
+    nested = "<section><p>a</p><p>" + "x" * 50 + "</p></section>"
+    with pytest.raises(ContentTooLarge):
+        enforce_budget(nested, truncate=True)
+
+
+def test_truncation_setting_is_read_at_call_time(small_budget, monkeypatch):
+    monkeypatch.setenv("WECHAT_TRUNCATE_OVERSIZED", "true")
+    assert enforce_budget("<p>a</p><p>" + "x" * 50 + "</p>") == "<p>a</p>"
+
+
+def test_content_within_budget_is_unchanged(small_budget):
+    assert enforce_budget("<p>short</p>") == "<p>short</p>"
+
+
+def test_inline_images_dedups_by_content_and_rewrites(monkeypatch):
+    monkeypatch.setattr(ContentOptimizer, "_load", staticmethod(
+        lambda src: PNG if src in (PNG_URI, "https://cdn.example.com/same.png") else None
+    ))
+    wechat = _FakeWechat()
+    html = (f'<p><img src="{PNG_URI}"><img alt="x" src=\'https://cdn.example.com/same.png\'></p>'
+            '<p><img src="https://mmbiz.qpic.cn/already"></p>'
+            '<p>t<img src="https://broken.example.com/a.jpg"></p>')
+
+    result = ContentOptimizer(wechat).inline_images(html)
+
+    assert wechat.uploads == [(PNG, "image.png")]
+    assert result == ('<p><img src="https://mmbiz.qpic.cn/1"><img alt="x" src=\'https://mmbiz.qpic.cn/1\'></p>'
+                      '<p><img src="https://mmbiz.qpic.cn/already"></p>'
+                      '<p>t</p>')
+
+
+def test_inline_images_ignores_data_src(monkeypatch):
+    monkeypatch.setattr(ContentOptimizer, "_load", staticmethod(lambda src: PNG))
+    wechat = _FakeWechat()
+    html = '<p><img data-src="https://a.com/x.png" src="https://b.com/y.png"></p>'
+
+    result = ContentOptimizer(wechat).inline_images(html)
+
+    assert len(wechat.uploads) == 1
+    assert result == '<p><img data-src="https://a.com/x.png" src="https://mmbiz.qpic.cn/1"></p>'
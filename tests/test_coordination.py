@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from coordination import CoordinationStore, Coordinator, SQLiteCoordinationStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteCoordinationStore(str(tmp_path / "coord.db"))
+
+
+def _replicas(store, count):
+    return [Coordinator(store, f"r{i}") for i in range(count)]
+
+
+def test_incomplete_store_fails_at_construction():
+    class PartialStore(CoordinationStore):
+        def acquire(self, name, owner, ttl):
+            return True
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_lease_is_exclusive_until_expiry(store):
+    assert store.acquire("x", "a", 0.2)
+    assert not store.acquire("x", "b", 0.2)
+    assert store.acquire("x", "a", 0.2)  # 持有者续约
+    assert store.owner_of("x") == "a"
+    time.sleep(0.25)
+    assert store.owner_of("x") is None
+    assert store.acquire("x", "b", 0.2)
+    assert not store.release("x", "a")
+    assert store.release("x", "b")
+
+
+def test_single_leader(store):
+    replicas = _replicas(store, 3)
+    assert [c.is_leader() for c in replicas] == [True, False, False]
+    assert replicas[1].leader() == "r0"
+
+
+def test_shards_are_processed_once_across_replicas(store):
+    replicas = _replicas(store, 3)
+    shards = [f"acct{i}" for i in range(12)]
+    processed = []
+    lock = threading.Lock()
+
+    def work(coordinator):
+        for shard in coordinator.claim_each("day", shards):
+            time.sleep(0.01)
+            with lock:
+                processed.append(shard)
+            coordinator.finish("day", shard)
+
+    threads = [threading.Thread(target=work, args=(c,)) for c in replicas]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(processed) == sorted(shards)
+    # 完成后任何副本（包括自身）都不会再次领取
+    assert all(list(c.claim_each("day", shards)) == [] for c in replicas)
+
+
+def test_expired_job_lease_is_taken_over(store):
+    crashed, survivor = _replicas(store, 2)
+    crashed.job_ttl = 0.1
+    assert crashed.claim("day", "acct")
+    assert not survivor.claim("day", "acct")
+    time.sleep(0.15)
+    assert survivor.claim("day", "acct")
+
+
+def test_heartbeat_keeps_lease_past_ttl(store):
+    owner, other = _replicas(store, 2)
+    owner.job_ttl = 0.15
+    assert owner.claim("day", "acct")
+    with owner.heartbeat("day", "acct"):
+        time.sleep(0.5)
+        assert not other.claim("day", "acct")
+    owner.finish("day", "acct")
+    assert not other.claim("day", "acct")
+
+
+def test_lost_heartbeat_is_recorded_and_not_finished(store):
+    owner, other = _replicas(store, 2)
+    owner.job_ttl = 0.15
+    assert owner.claim("day", "acct")
+    with owner.heartbeat("day", "acct") as lease:
+        assert lease.held
+        # 模拟租约被其它副本接手（如本副本长时间停顿后过期）
+        store.release("job:day:acct", "r0")
+        assert other.claim("day", "acct")
+        time.sleep(0.2)
+        assert lease._lost.is_set() and not lease.held
+
+    assert not owner.finish("day", "acct")
+    assert store.owner_of("done:day:acct") is None
+    assert store.owner_of("job:day:acct") == "r1"
+    assert other.finish("day", "acct")
+
+
+def test_finish_after_takeover_does_not_mark_done(store):
+    crashed, survivor = _replicas(store, 2)
+    crashed.job_ttl = 0.1
+    assert crashed.claim("day", "acct")
+    time.sleep(0.15)
+    assert survivor.claim("day", "acct")
+    assert not crashed.finish("day", "acct")
+    assert store.owner_of("done:day:acct") is None
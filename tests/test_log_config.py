@@ -0,0 +1,60 @@
+import json
+
+from loguru import logger
+
+from log_config import setup_logging, job_context, truncate
+
+
+def _read_json_lines(directory):
+    lines = []
+    for path in directory.glob("*.jsonl"):
+        lines += [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    return lines
+
+
+def test_truncate():
+    assert truncate("short") == "short"
+    text = truncate("x" * 50, limit=10)
+    assert text.startswith("x" * 10) and "50" in text
+
+
+def test_truncate_reads_limit_at_call_time(monkeypatch):
+    monkeypatch.setenv("LOG_MAX_PAYLOAD_CHARS", "5")
+    assert truncate("x" * 20).startswith("x" * 5 + "...")
+
+
+def test_json_sink_carries_job_context_and_traceback(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    logger.remove()
+    setup_logging(str(tmp_path / "app_{time}.log"))
+    try:
+        with job_context(job_id="job-1", account_id="wx-1"):
+            logger.info("hello")
+            try:
+                raise RuntimeError("boom")
+            except RuntimeError:
+                logger.exception("failed")
+        logger.complete()
+    finally:
+        logger.remove()
+
+    lines = _read_json_lines(tmp_path)
+    assert [line["message"] for line in lines] == ["hello", "failed"]
+    assert all(line["job_id"] == "job-1" and line["account_id"] == "wx-1" for line in lines)
+    assert lines[1]["exception"] == "RuntimeError: boom"
+    assert "Traceback" in lines[1]["traceback"] and "raise RuntimeError" in lines[1]["traceback"]
+
+
+def test_debug_sampling_keeps_other_levels(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    monkeypatch.setenv("LOG_DEBUG_SAMPLE_RATE", "0")
+    logger.remove()
+    setup_logging(str(tmp_path / "app.log"))
+    try:
+        logger.debug("dropped")
+        logger.warning("kept")
+        logger.complete()
+    finally:
+        logger.remove()
+
+    assert [line["message"] for line in _read_json_lines(tmp_path)] == ["kept"]
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from loguru import logger
+
+from pipeline import Pipeline, PipelineAbort, map_concurrently
+
+
+def _one(inputs):
+    return 1
+
+
+def _slow_left(inputs):
+    time.sleep(0.2)
+    return inputs["a"] + 1
+
+
+def _slow_right(inputs):
+    time.sleep(0.2)
+    return inputs["a"] + 2
+
+
+def _join(inputs):
+    return inputs["b"] + inputs["c"]
+
+
+def _diamond(name="diamond", **kwargs):
+    return (Pipeline(name, **kwargs)
+            .add("a", _one)
+            .add("b", _slow_left, ["a"])
+            .add("c", _slow_right, ["a"])
+            .add("d", _join, ["b", "c"]))
+
+
+@pytest.mark.parametrize("executor", Pipeline.EXECUTORS)
+def test_executors_produce_same_values(executor):
+    result = _diamond().run(executor)
+    assert result.ok
+    assert result.values == {"a": 1, "b": 2, "c": 3, "d": 5}
+    assert set(result.timings) == {"a", "b", "c", "d"}
+
+
+@pytest.mark.parametrize("executor", ["thread", "asyncio"])
+def test_independent_stages_run_in_parallel(executor):
+    start = time.perf_counter()
+    _diamond().run(executor)
+    assert time.perf_counter() - start < 0.35
+
+
+def test_async_stage_is_awaited():
+    async def stage(inputs):
+        await asyncio.sleep(0)
+        return inputs["a"] * 10
+
+    result = Pipeline().add("a", _one).add("b", stage, ["a"]).run("asyncio")
+    assert result["b"] == 10
+
+
+def _abort(inputs):
+    raise PipelineAbort("stop")
+
+
+@pytest.mark.parametrize("executor", Pipeline.EXECUTORS)
+def test_failure_skips_only_downstream(executor):
+    result = (Pipeline()
+              .add("a", _one)
+              .add("z", _abort, ["a"])
+              .add("after_z", _one, ["z"])
+              .add("after_after_z", _one, ["after_z"])
+              .add("sibling", _one, ["a"])
+              .run(executor))
+
+    assert not result.ok
+    assert isinstance(result.errors["z"], PipelineAbort)
+    assert result.skipped == ["after_z", "after_after_z"]
+    assert result["sibling"] == 1
+
+
+def test_executor_level_failure_becomes_stage_error():
+    lock = threading.Lock()
+    # lambda 与线程锁均无法被 pickle，进程池提交失败应记为阶段错误而不是抛出
+    result = Pipeline().add("a", lambda inputs: lock).add("b", _one, ["a"]).run("process")
+    assert not result.ok
+    assert "a" in result.errors
+    assert result.skipped == ["b"]
+
+
+def _fail(inputs):
+    raise RuntimeError("boom")
+
+
+def test_stage_failure_logs_traceback():
+    messages = []
+    sink = logger.add(messages.append, level="ERROR", format="{message}")
+    try:
+        Pipeline().add("a", _fail).run("inline")
+    finally:
+        logger.remove(sink)
+
+    record = messages[0].record
+    assert record["exception"] is not None and record["exception"].type is RuntimeError
+    assert record["exception"].traceback is not None
+
+
+def test_unsupported_executor_is_rejected():
+    with pytest.raises(ValueError):
+        _diamond(executors=("inline", "thread")).run("process")
+    with pytest.raises(ValueError):
+        _diamond().run("bogus")
+
+
+def test_add_rejects_unknown_and_duplicate_stages():
+    pipeline = Pipeline().add("a", _one)
+    with pytest.raises(ValueError):
+        pipeline.add("a", _one)
+    with pytest.raises(ValueError):
+        pipeline.add("b", _one, ["missing"])
+
+
+def test_map_concurrently_preserves_order():
+    assert map_concurrently(lambda x: x * 2, [3, 1, 2], 4) == [6, 2, 4]
+    assert map_concurrently(lambda x: x, [], 4) == []
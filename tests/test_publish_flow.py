@@ -0,0 +1,55 @@
+import pytest
+
+import publish_flow
+from pipeline import PipelineAbort
+from response_cache import CacheMiss
+
+
+class _Wechat:
+    app_id = "wx-test"
+
+
+class _LostLease:
+    held = False
+
+
+class _ReplayMissQwen:
+    def generate_article(self, topic):
+        raise CacheMiss("miss")
+
+
+def test_article_replay_miss_aborts_instead_of_placeholder():
+    with pytest.raises(PipelineAbort):
+        publish_flow._stage_article(_ReplayMissQwen(), {"topic": "t"})
+
+
+def test_topic_is_replayed_per_run(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_MODE", "replay_or_record")
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "c.db"))
+    monkeypatch.setenv("LLM_CACHE_RUN_KEY", "run-1")
+
+    first = publish_flow._stage_topic(_Wechat(), {})
+    assert all(publish_flow._stage_topic(_Wechat(), {}) == first for _ in range(20))
+
+
+def test_topic_replay_miss_aborts(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_MODE", "replay")
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "c.db"))
+    with pytest.raises(PipelineAbort):
+        publish_flow._stage_topic(_Wechat(), {})
+
+
+def test_publish_pipeline_rejects_process_executor():
+    pipeline = publish_flow.build_publish_pipeline(object(), _Wechat(), object())
+    with pytest.raises(ValueError):
+        pipeline.run("process")
+
+
+def test_draft_is_not_created_after_lease_is_lost():
+    class _DraftWechat(_Wechat):
+        def add_draft(self, article, media_id):
+            raise AssertionError("租约丢失后不应提交草稿")
+
+    inputs = {"content": {"title": "t"}, "upload": "media-1", "image": {"url": None, "path": None}}
+    with pytest.raises(PipelineAbort):
+        publish_flow._stage_draft(_DraftWechat(), _LostLease(), inputs)
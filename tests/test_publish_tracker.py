@@ -0,0 +1,102 @@
+import json
+import time
+
+from loguru import logger
+
+from log_config import setup_logging, job_context
+from publish_tracker import PublishTracker, PublishResult
+
+
+class _FakeWechat:
+    """publish_status 在 ready_after 次查询后返回 final_status"""
+
+    def __init__(self, app_id, ready_after=2, final_status=0, fail_submit=()):
+        self.app_id = app_id
+        self.ready_after = ready_after
+        self.final_status = final_status
+        self.fail_submit = set(fail_submit)
+        self.polls = {}
+
+    def submit_publish(self, media_id):
+        return None if media_id in self.fail_submit else f"{self.app_id}-{media_id}"
+
+    def get_publish_status(self, publish_id):
+        self.polls[publish_id] = self.polls.get(publish_id, 0) + 1
+        if self.polls[publish_id] <= self.ready_after:
+            return {"publish_status": PublishResult.STATUS_PUBLISHING}
+        return {"publish_status": self.final_status, "article_id": f"art-{publish_id}"}
+
+
+def _tracker(**kwargs):
+    options = dict(min_interval=0.01, max_interval=0.05, backoff=2, timeout=5)
+    options.update(kwargs)
+    return PublishTracker(**options)
+
+
+def test_submit_does_not_block():
+    tracker = _tracker(min_interval=60)
+    start = time.perf_counter()
+    results = tracker.submit(_FakeWechat("wx1"), ["m1", "m2"])
+    assert time.perf_counter() - start < 1
+    assert [r.done for r in results] == [False, False]
+    assert tracker.pending == 2
+
+
+def test_poll_due_only_queries_due_tasks():
+    tracker = _tracker(min_interval=60)
+    wechat = _FakeWechat("wx1")
+    tracker.submit(wechat, ["m1"])
+    assert tracker.poll_due() == []
+    assert wechat.polls == {}
+
+
+def test_batches_across_accounts_with_results_and_latency():
+    tracker = _tracker()
+    ok, failing = _FakeWechat("wx1"), _FakeWechat("wx2", final_status=3, fail_submit={"bad"})
+    results = tracker.submit(ok, ["m1", "m2"]) + tracker.submit(failing, ["m1", "bad"])
+
+    finished = tracker.wait_all()
+
+    assert len(finished) == 3 and tracker.pending == 0
+    assert [r.success for r in results] == [True, True, False, False]
+    assert results[0].article_id == "art-wx1-m1"
+    assert results[2].error == PublishResult.STATUS_TEXT[3]
+    assert results[3].error == "发布任务提交失败" and results[3].publish_id is None
+    assert all(r.latency is not None and r.latency >= 0 for r in results)
+    assert results[0].polls == 3
+
+
+def test_backoff_is_capped():
+    tracker = _tracker(min_interval=0.01, max_interval=0.02, backoff=10)
+    tracker.submit(_FakeWechat("wx1", ready_after=3), ["m1"])
+    key = ("wx1", "wx1-m1")
+    time.sleep(0.02)
+    tracker.poll_due()
+    assert tracker._intervals[key] == 0.02
+
+
+def test_timeout_finishes_task():
+    tracker = _tracker(timeout=0.03)
+    result = tracker.submit(_FakeWechat("wx1", ready_after=10 ** 6), ["m1"])[0]
+    tracker.wait_all()
+    assert result.done and not result.success
+    assert result.error == "发布状态查询超时"
+
+
+def test_results_are_logged_in_submitting_job_context(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOG_FORMAT", "json")
+    logger.remove()
+    setup_logging(str(tmp_path / "app.log"))
+    try:
+        tracker = _tracker()
+        with job_context(job_id="job-1", account_id="wx1"):
+            tracker.submit(_FakeWechat("wx1"), ["m1"])
+        # 在任务上下文之外轮询（如调度器的轮询任务）
+        tracker.wait_all()
+        logger.complete()
+    finally:
+        logger.remove()
+
+    lines = [json.loads(line) for path in tmp_path.glob("*.jsonl") for line in path.read_text(encoding="utf-8").splitlines()]
+    result_line = next(line for line in lines if line["message"].startswith("发布成功"))
+    assert result_line["job_id"] == "job-1" and result_line["account_id"] == "wx1"
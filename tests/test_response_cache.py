@@ -0,0 +1,75 @@
+import pytest
+
+from response_cache import ResponseCache, CacheMiss
+
+
+def _counter(value):
+    calls = []
+
+    def producer():
+        calls.append(1)
+        return value
+    return producer, calls
+
+
+def test_off_mode_always_calls_producer(tmp_path):
+    cache = ResponseCache("off", str(tmp_path / "c.db"))
+    producer, calls = _counter({"a": 1})
+    cache.fetch("ns", "m", "p", None, producer)
+    cache.fetch("ns", "m", "p", None, producer)
+    assert len(calls) == 2
+    assert not (tmp_path / "c.db").exists()
+
+
+def test_record_then_replay(tmp_path):
+    path = str(tmp_path / "c.db")
+    producer, calls = _counter({"title": "中文"})
+    assert ResponseCache("record", path).fetch("ns", "m", "p", {"t": 1}, producer) == {"title": "中文"}
+
+    replay = ResponseCache("replay", path)
+    assert replay.fetch("ns", "m", "p", {"t": 1}, producer) == {"title": "中文"}
+    assert len(calls) == 1
+
+
+def test_replay_miss_raises(tmp_path):
+    cache = ResponseCache("replay", str(tmp_path / "c.db"))
+    producer, calls = _counter("x")
+    with pytest.raises(CacheMiss):
+        cache.fetch("ns", "m", "p", None, producer)
+    assert not calls
+
+
+def test_key_includes_params(tmp_path):
+    cache = ResponseCache("replay_or_record", str(tmp_path / "c.db"))
+    producer, calls = _counter("x")
+    cache.fetch("ns", "m", "p", {"t": 1}, producer)
+    cache.fetch("ns", "m", "p", {"t": 2}, producer)
+    cache.fetch("ns", "m", "p", {"t": 1}, producer)
+    assert len(calls) == 2
+
+
+def test_none_and_exceptions_are_not_recorded(tmp_path):
+    cache = ResponseCache("replay_or_record", str(tmp_path / "c.db"))
+
+    def failing():
+        raise ValueError("bad response")
+
+    with pytest.raises(ValueError):
+        cache.fetch("ns", "m", "p", None, failing)
+    assert cache.fetch("ns", "m", "p", None, lambda: None) is None
+    assert cache.fetch("ns", "m", "p", None, lambda: "ok") == "ok"
+
+
+def test_invalid_cached_value_is_a_miss(tmp_path):
+    path = str(tmp_path / "c.db")
+    ResponseCache("record", path).fetch("ns", "m", "p", None, lambda: "/missing/file.png")
+
+    with pytest.raises(CacheMiss):
+        ResponseCache("replay", path).fetch("ns", "m", "p", None, lambda: "new", validate=lambda v: False)
+    assert ResponseCache("replay_or_record", path).fetch(
+        "ns", "m", "p", None, lambda: "new", validate=lambda v: False
+    ) == "new"
+
+
+def test_unknown_mode_disables_cache():
+    assert not ResponseCache("bogus", "unused.db").enabled
@@ -3,16 +3,37 @@
 import os
 import requests
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from loguru import logger
 import time
 
+from log_config import truncate
+
+def load_accounts() -> List[Tuple[str, str]]:
+    """
+    读取公众号账号列表
+    
+    WECHAT_ACCOUNTS 格式为 "appid1:secret1,appid2:secret2"，
+    未配置时使用 WECHAT_APP_ID / WECHAT_APP_SECRET 单账号。
+    """
+    accounts = []
+    for item in os.getenv("WECHAT_ACCOUNTS", "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        app_id, _, app_secret = item.partition(":")
+        accounts.append((app_id.strip(), app_secret.strip()))
+    
+    if not accounts:
+        accounts.append((os.getenv("WECHAT_APP_ID"), os.getenv("WECHAT_APP_SECRET")))
+    return accounts
+
 class WeChatClient:
     """微信公众号API客户端"""
     
-    def __init__(self):
-        self.app_id = os.getenv("WECHAT_APP_ID")
-        self.app_secret = os.getenv("WECHAT_APP_SECRET")
+    def __init__(self, app_id: str = None, app_secret: str = None):
+        self.app_id = app_id or os.getenv("WECHAT_APP_ID")
+        self.app_secret = app_secret or os.getenv("WECHAT_APP_SECRET")
         self.access_token = None
         self.token_expires = 0
         
@@ -38,7 +59,7 @@ class WeChatClient:
                 logger.info("access_token获取成功")
                 return self.access_token
             else:
-                logger.error(f"获取token失败: {data}")
+                logger.error(f"获取token失败: {truncate(data)}")
                 return None
         except Exception as e:
             logger.error(f"获取token异常: {e}")
@@ -84,23 +105,107 @@ class WeChatClient:
                 logger.success(f"图片上传成功，media_id: {data['media_id']}")
                 return data["media_id"]
             else:
-                logger.error(f"图片上传失败: {data}")
+                logger.error(f"图片上传失败: {truncate(data)}")
                 return None
         except Exception as e:
             logger.error(f"图片上传异常: {e}")
             return None
     
-    def add_draft(self, article: Dict[str, Any], thumb_media_id: str) -> bool:
+    def upload_permanent_image(self, image_url: str) -> Optional[str]:
+        """
+        从URL下载图片并上传为永久图片素材（草稿封面 thumb_media_id 需使用永久素材）
+        
+        Returns:
+            media_id: 素材ID
+        """
+        token = self._get_access_token()
+        if not token:
+            return None
+        
+        # 下载图片
+        try:
+            img_resp = requests.get(image_url, timeout=30)
+            if img_resp.status_code != 200:
+                logger.error(f"图片下载失败: {image_url}")
+                return None
+        except Exception as e:
+            logger.error(f"图片下载异常: {e}")
+            return None
+        
+        # 上传到永久素材库
+        url = "https://api.weixin.qq.com/cgi-bin/material/add_material"
+        params = {
+            "access_token": token,
+            "type": "image"
+        }
+        
+        files = {
+            "media": ("image.jpg", img_resp.content, "image/jpeg")
+        }
+        
+        try:
+            resp = requests.post(url, params=params, files=files, timeout=30)
+            data = resp.json()
+            
+            if "media_id" in data:
+                logger.success(f"永久素材上传成功，media_id: {data['media_id']}")
+                return data["media_id"]
+            else:
+                logger.error(f"永久素材上传失败: {truncate(data)}")
+                return None
+        except Exception as e:
+            logger.error(f"永久素材上传异常: {e}")
+            return None
+    
+    def upload_content_image(self, image_content: bytes, filename: str = "image.jpg") -> Optional[str]:
+        """
+        上传图文正文内的图片（media/uploadimg），正文中的图片必须使用该接口返回的URL
+        
+        Args:
+            image_content: 图片二进制内容（jpg/png，小于1MB）
+            
+        Returns:
+            图片URL
+        """
+        token = self._get_access_token()
+        if not token:
+            return None
+        
+        url = "https://api.weixin.qq.com/cgi-bin/media/uploadimg"
+        params = {"access_token": token}
+        
+        files = {
+            "media": (filename, image_content, "image/png" if filename.endswith(".png") else "image/jpeg")
+        }
+        
+        try:
+            resp = requests.post(url, params=params, files=files, timeout=30)
+            data = resp.json()
+            
+            if "url" in data:
+                logger.success(f"正文图片上传成功: {data['url']}")
+                return data["url"]
+            else:
+                logger.error(f"正文图片上传失败: {truncate(data)}")
+                return None
+        except Exception as e:
+            logger.error(f"正文图片上传异常: {e}")
+            return None
+    
+    def add_draft(self, article: Dict[str, Any], thumb_media_id: str) -> Optional[str]:
         """
         添加图文草稿
         
         Args:
             article: 文章内容（含title, content, author等）
             thumb_media_id: 封面图素材ID
+            
+        Returns:
+            media_id: 草稿ID，失败返回 None
         """
         token = self._get_access_token()
         if not token:
-            return False
+            return None
         
         url = "https://api.weixin.qq.com/cgi-bin/draft/add"
         params = {"access_token": token}
@@ -127,10 +232,68 @@ class WeChatClient:
             
             if "media_id" in result:
                 logger.success(f"草稿创建成功，media_id: {result['media_id']}")
-                return True
+                return result["media_id"]
             else:
-                logger.error(f"草稿创建失败: {result}")
-                return False
+                logger.error(f"草稿创建失败: {truncate(result)}")
+                return None
         except Exception as e:
             logger.error(f"草稿创建异常: {e}")
-            return False
+            return None
+    
+    def submit_publish(self, media_id: str) -> Optional[str]:
+        """
+        发布草稿（freepublish/submit），发布为异步过程，需轮询状态
+        
+        Args:
+            media_id: 草稿ID
+            
+        Returns:
+            publish_id: 发布任务ID
+        """
+        token = self._get_access_token()
+        if not token:
+            return None
+        
+        url = "https://api.weixin.qq.com/cgi-bin/freepublish/submit"
+        params = {"access_token": token}
+        
+        try:
+            resp = requests.post(url, params=params, json={"media_id": media_id}, timeout=15)
+            result = resp.json()
+            
+            if result.get("errcode", 0) == 0 and "publish_id" in result:
+                logger.success(f"发布任务提交成功，publish_id: {result['publish_id']}")
+                return str(result["publish_id"])
+            else:
+                logger.error(f"发布任务提交失败: {truncate(result)}")
+                return None
+        except Exception as e:
+            logger.error(f"发布任务提交异常: {e}")
+            return None
+    
+    def get_publish_status(self, publish_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询发布状态（freepublish/get）
+        
+        Returns:
+            接口原始返回，publish_status: 0 成功，1 发布中，2+ 失败；请求失败返回 None
+        """
+        token = self._get_access_token()
+        if not token:
+            return None
+        
+        url = "https://api.weixin.qq.com/cgi-bin/freepublish/get"
+        params = {"access_token": token}
+        
+        try:
+            resp = requests.post(url, params=params, json={"publish_id": publish_id}, timeout=10)
+            result = resp.json()
+            
+            if "publish_status" in result:
+                return result
+            else:
+                logger.error(f"发布状态查询失败: {truncate(result)}")
+                return None
+        except Exception as e:
+            logger.error(f"发布状态查询异常: {e}")
+            return None